@@ -14,6 +14,8 @@ from flask_cors import CORS
 # Create Flask application
 app = Flask(__name__)
 app.config.from_object(config)
+# Match routes with or without a trailing slash instead of redirecting
+app.url_map.strict_slashes = False
 
 # Create an instance of Talisman
 talisman = Talisman(app)
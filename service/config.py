@@ -18,6 +18,16 @@ if not DATABASE_URI:
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+SQLALCHEMY_ENGINE_OPTIONS = {
+    # Per worker, so keep the defaults well under the server's max_connections
+    "pool_size": int(os.getenv("DATABASE_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW", "10")),
+    "pool_pre_ping": False,
+    # Send executemany INSERTs as multi-row VALUES statements with psycopg2
+    "executemany_mode": "values_plus_batch",
+    "executemany_values_page_size": 1000,
+    "executemany_batch_page_size": 500,
+}
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
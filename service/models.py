@@ -5,6 +5,9 @@ All of the models are stored in this module
 """
 import logging
 from datetime import date
+from operator import attrgetter
+from typing import Optional
+import msgspec
 from flask_sqlalchemy import SQLAlchemy
 
 logger = logging.getLogger("flask.app")
@@ -69,6 +72,12 @@ class PersistentBase:
         logger.info("Processing all records")
         return cls.query.all()
 
+    @classmethod
+    def all_in_batches(cls, batch_size):
+        """Iterates over all of the records, loading batch_size rows at a time"""
+        logger.info("Processing all records in batches of %s", batch_size)
+        return cls.query.yield_per(batch_size)
+
     @classmethod
     def find(cls, by_id):
         """Finds a record by it's ID"""
@@ -99,14 +108,17 @@ class Account(db.Model, PersistentBase):
 
     def serialize(self):
         """Serializes a Account into a dictionary"""
-        return {
-            "id": self.id,
-            "name": self.name,
-            "email": self.email,
-            "address": self.address,
-            "phone_number": self.phone_number,
-            "date_joined": self.date_joined.isoformat()
-        }
+        data = dict(zip(ACCOUNT_COLUMNS, _get_account_columns(self)))
+        data["date_joined"] = data["date_joined"].isoformat()
+        return data
+
+    def to_schema(self):
+        """Copies a Account into an AccountSchema for the msgspec encoders"""
+        return AccountSchema(*_get_account_columns(self))
+
+    def to_json(self):
+        """Serializes a Account straight into JSON bytes"""
+        return _encode_account(self.to_schema())
 
     def deserialize(self, data):
         """
@@ -132,6 +144,8 @@ class Account(db.Model, PersistentBase):
                 "Invalid Account: body of request contained "
                 "bad or no data - " + error.args[0]
             ) from error
+        except ValueError as error:
+            raise DataValidationError("Invalid Account: " + error.args[0]) from error
         return self
 
     @classmethod
@@ -143,3 +157,25 @@ class Account(db.Model, PersistentBase):
         """
         logger.info("Processing name query for %s ...", name)
         return cls.query.filter(cls.name == name)
+
+
+# The Account columns never change at runtime so look them up once at import
+ACCOUNT_COLUMNS = tuple(column.name for column in Account.__table__.columns)
+_get_account_columns = attrgetter(*ACCOUNT_COLUMNS)
+
+
+class AccountSchema(msgspec.Struct):
+    """The fixed JSON shape of an Account, fields in ACCOUNT_COLUMNS order"""
+
+    # pylint: disable=too-few-public-methods
+
+    id: int
+    name: str
+    email: str
+    address: str
+    phone_number: Optional[str]
+    date_joined: date
+
+
+# A single encoder is reused for every Account instead of one per call
+_encode_account = msgspec.json.Encoder().encode
@@ -4,11 +4,52 @@ Account Service
 This microservice handles the lifecycle of Accounts
 """
 # pylint: disable=unused-import
-from flask import jsonify, request, make_response, abort, url_for   # noqa; F401
-from service.models import Account
+import threading
+import zlib
+from itertools import chain, islice
+from operator import attrgetter
+import msgspec
+from sqlalchemy import insert
+from cachetools import TTLCache
+from flask import (  # noqa; F401
+    jsonify, request, make_response, abort, url_for, stream_with_context
+)
+from service.models import db, Account, ACCOUNT_COLUMNS
 from service.common import status  # HTTP Status Codes
 from . import app  # Import Flask application
 
+# Number of rows fetched from the database at a time when listing accounts
+LIST_BATCH_SIZE = 1000
+# The account list is gzipped as it streams once it reaches this many bytes
+LIST_GZIP_MIN_SIZE = 1024
+LIST_GZIP_LEVEL = 4
+
+# Columns written by a bulk INSERT, the id is generated by the database
+_BULK_COLUMNS = tuple(name for name in ACCOUNT_COLUMNS if name != "id")
+_get_bulk_columns = attrgetter(*_BULK_COLUMNS)
+
+# The only media type accepted for request bodies
+JSON_MEDIA_TYPE = "application/json"
+# Endpoints whose request body must be JSON, checked before the view is called
+_JSON_ENDPOINTS = frozenset(("create_accounts", "bulk_create_accounts"))
+
+# Media types list_accounts can respond with, the first is used when either will do
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_LIST_MEDIA_TYPES = (JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE)
+_encode_json = msgspec.json.Encoder().encode
+_encode_msgpack = msgspec.msgpack.Encoder().encode
+
+# The health and index bodies never change so they are encoded once at import
+_HEALTH_BODY = msgspec.json.encode({"status": "OK"})
+_INDEX_BODY = msgspec.json.encode({"name": "Account REST API Service", "version": "1.0"})
+
+# Encoded Accounts keyed by id, so repeat reads skip the database and the encoder
+ACCOUNT_CACHE_SIZE = 10_000
+ACCOUNT_CACHE_TTL = 30  # seconds
+_ACCOUNT_CACHE = TTLCache(maxsize=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL)
+# cachetools caches are not thread safe, every access goes through this lock
+_ACCOUNT_CACHE_LOCK = threading.Lock()
+
 
 ############################################################
 # Health Endpoint
@@ -16,7 +57,7 @@ from . import app  # Import Flask application
 @app.route("/health")
 def health():
     """Health Status"""
-    return jsonify(dict(status="OK")), status.HTTP_200_OK
+    return _json_response(_HEALTH_BODY, status.HTTP_200_OK)
 
 
 ######################################################################
@@ -25,14 +66,8 @@ def health():
 @app.route("/")
 def index():
     """Root URL response"""
-    return (
-        jsonify(
-            name="Account REST API Service",
-            version="1.0",
-            # paths=url_for("list_accounts", _external=True),
-        ),
-        status.HTTP_200_OK,
-    )
+    # paths=url_for("list_accounts", _external=True) is left out so the body stays constant
+    return _json_response(_INDEX_BODY, status.HTTP_200_OK)
 
 
 ######################################################################
@@ -45,17 +80,45 @@ def create_accounts():
     This endpoint will create an Account based the data in the body that is posted
     """
     app.logger.info("Request to create an Account")
-    check_content_type("application/json")
     account = Account()
     account.deserialize(request.get_json())
     account.create()
-    message = account.serialize()
     # Uncomment once get_accounts has been implemented
     # location_url = url_for("get_accounts", account_id=account.id, _external=True)
     location_url = "/"  # Remove once get_accounts has been implemented
-    return make_response(
-        jsonify(message), status.HTTP_201_CREATED, {"Location": location_url}
-    )
+    # Keep the encoded account so the first read of it does not encode it again
+    body = _cache_account(account.id, account.to_json())
+    return _json_response(body, status.HTTP_201_CREATED, {"Location": location_url})
+
+
+######################################################################
+# CREATE ACCOUNTS IN BULK
+######################################################################
+@app.route("/accounts/bulk", methods=["POST"])
+def bulk_create_accounts():
+    """
+    Creates many Accounts at once
+    This endpoint expects a JSON array of Accounts and inserts them in batches
+    that are committed as a single transaction
+    """
+    app.logger.info("Request to create Accounts in bulk")
+    payload = request.get_json()
+    if not isinstance(payload, list):
+        abort(status.HTTP_400_BAD_REQUEST, "Request body must be a list of Accounts")
+
+    # Validate every Account before anything is written to the database
+    rows = [
+        dict(zip(_BULK_COLUMNS, _get_bulk_columns(account)))
+        for account in (Account().deserialize(data) for data in payload)
+    ]
+    # psycopg2 sends these as multi-row INSERT ... VALUES statements, see
+    # SQLALCHEMY_ENGINE_OPTIONS for the number of rows in each
+    if rows:
+        db.session.execute(insert(Account), rows)
+    db.session.commit()
+
+    app.logger.info("Created %s accounts in bulk", len(rows))
+    return jsonify(created=len(rows)), status.HTTP_201_CREATED
 
 
 ######################################################################
@@ -67,14 +130,44 @@ def list_accounts():
     """
     This endpoint retrieves all accounts
     """
-    # Retrieve all account objects
-    accounts = Account.all()
-    # Create a list of serialized accounts
-    accounts_serialized = [account.serialize() for account in accounts]
-    # Log the number of accounts being returned
-    app.logger.info(f'Returning {len(accounts_serialized)} accounts')
-    # Return the serialized list with status code 200 - OK
-    return jsonify(accounts_serialized), status.HTTP_200_OK
+    app.logger.info("Request to list all Accounts")
+
+    if request.accept_mimetypes.best_match(_LIST_MEDIA_TYPES) == MSGPACK_MEDIA_TYPE:
+        # A MessagePack array starts with its length so the list is encoded in one go
+        accounts = [
+            account.to_schema() for account in Account.all_in_batches(LIST_BATCH_SIZE)
+        ]
+        return app.response_class(
+            _encode_msgpack(accounts),
+            status=status.HTTP_200_OK,
+            headers={"Vary": "Accept"},
+            mimetype=MSGPACK_MEDIA_TYPE,
+        )
+
+    def generate():
+        # Stream the accounts from the database one batch at a time so neither
+        # the rows nor their JSON ever have to be held in memory all at once.
+        # Each batch is encoded with one call and its brackets are dropped so
+        # the batches join into a single JSON array
+        accounts = iter(Account.all_in_batches(LIST_BATCH_SIZE))
+        separator = b"["
+        batch = [account.to_schema() for account in islice(accounts, LIST_BATCH_SIZE)]
+        while batch:
+            yield separator + _encode_json(batch)[1:-1]
+            separator = b","
+            batch = [account.to_schema() for account in islice(accounts, LIST_BATCH_SIZE)]
+        yield b"[]" if separator == b"[" else b"]"
+
+    body = stream_with_context(generate())
+    # The body depends on both the Accept and the Accept-Encoding headers
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if request.accept_encodings["gzip"]:
+        body, compressed = _gzip_stream(body)
+        if compressed:
+            headers["Content-Encoding"] = "gzip"
+
+    # Return the streamed list with status code 200 - OK
+    return _json_response(body, status.HTTP_200_OK, headers)
 
 
 ######################################################################
@@ -86,14 +179,19 @@ def read_account(account_id):
     """
     This endpoint retrieves an account based on the ID passed in as a parameter
     """
-    # Call the 'find' method to return the account with the account id
-    account = Account.find(account_id)
-    # If account not found abort with 404
-    if not account:
-        abort(status.HTTP_404_NOT_FOUND, f'Account with id: {account_id} could not be found.')
+    # Serve the already encoded account if it was read recently
+    with _ACCOUNT_CACHE_LOCK:
+        body = _ACCOUNT_CACHE.get(account_id)
+    if body is None:
+        # Call the 'find' method to return the account with the account id
+        account = Account.find(account_id)
+        # If account not found abort with 404
+        if not account:
+            abort(status.HTTP_404_NOT_FOUND, f'Account with id: {account_id} could not be found.')
+        body = _cache_account(account_id, account.to_json())
 
     # Return the serialized account object, along with a 200 - OK status code
-    return account.serialize(), status.HTTP_200_OK
+    return _json_response(body, status.HTTP_200_OK)
 
 
 ######################################################################
@@ -109,14 +207,17 @@ def update_account(account_id):
     account = Account.find(account_id)
     # Abort with status code 404 if the account with the id was not found
     if not account:
+        _evict_account(account_id)  # it may have been deleted elsewhere
         abort(status.HTTP_404_NOT_FOUND, f'Account with id: {account_id} could not be found.')
     # Otherwise deserialize the object, then update it in the db
     account.deserialize(request.get_json())
     account.update()
+    # Replace the cached account with the updated one, it is encoded only once
+    body = _cache_account(account_id, account.to_json())
 
     # Return the serialized version of the updated account object along with a status
     # code 200 - OK
-    return account.serialize(), status.HTTP_200_OK
+    return _json_response(body, status.HTTP_200_OK)
 
 
 ######################################################################
@@ -132,9 +233,11 @@ def delete_account(account_id):
     account = Account.find(account_id)
     # Abort with status code 404 if the account with the id was not found
     if not account:
+        _evict_account(account_id)  # it may have been deleted elsewhere
         abort(status.HTTP_404_NOT_FOUND, f'Account with id: {account_id} could not be found.')
     # If found call the 'delete' method on the account
     account.delete()
+    _evict_account(account_id)
     # Return an empty body with a status code 204 - NO CONTENT
     return "", status.HTTP_204_NO_CONTENT
 
@@ -143,13 +246,59 @@ def delete_account(account_id):
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
 
-def check_content_type(media_type):
-    """Checks that the media type is correct"""
-    content_type = request.headers.get("Content-Type")
-    if content_type and content_type == media_type:
+def _json_response(body, code=status.HTTP_200_OK, headers=None):
+    """Wraps an already encoded JSON body in a response"""
+    return app.response_class(body, status=code, headers=headers, mimetype="application/json")
+
+
+def _cache_account(account_id, body):
+    """Stores the encoded Account in the cache and returns it"""
+    with _ACCOUNT_CACHE_LOCK:
+        _ACCOUNT_CACHE[account_id] = body
+    return body
+
+
+def _evict_account(account_id):
+    """Removes an Account from the cache if it is there"""
+    with _ACCOUNT_CACHE_LOCK:
+        _ACCOUNT_CACHE.pop(account_id, None)
+
+
+def _gzip_stream(chunks):
+    """Gzips a streamed body chunk by chunk
+
+    Chunks are only read ahead until LIST_GZIP_MIN_SIZE is reached, a body that
+    ends before that is returned joined and uncompressed. Returns the body and
+    whether it was compressed
+    """
+    head = []
+    size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= LIST_GZIP_MIN_SIZE:
+            return _gzip_chunks(chain(head, chunks)), True
+    return b"".join(head), False
+
+
+def _gzip_chunks(chunks):
+    """Compresses each chunk as it is produced so the body is never buffered"""
+    compressor = zlib.compressobj(LIST_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.before_request
+def check_content_type():
+    """Checks that the media type is correct for endpoints that accept a JSON body"""
+    # request.mimetype is parsed once by werkzeug and has any parameters removed
+    if request.endpoint not in _JSON_ENDPOINTS or request.mimetype == JSON_MEDIA_TYPE:
         return
-    app.logger.error("Invalid Content-Type: %s", content_type)
+    app.logger.error("Invalid Content-Type: %s", request.content_type)
     abort(
         status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-        f"Content-Type must be {media_type}",
+        f"Content-Type must be {JSON_MEDIA_TYPE}",
     )